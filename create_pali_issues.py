@@ -1,8 +1,32 @@
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import yaml
 from dotenv import load_dotenv
 
+# Prefer the libyaml-backed loader; fall back to pure Python if unavailable.
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+# Prefer orjson for (de)serializing JSON; fall back to the stdlib.
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
 # Load .env file from current directory
 load_dotenv()
 
@@ -24,7 +48,30 @@ HEADERS = {
     "Accept": "application/vnd.github+json",
 }
 
+# One keep-alive connection pool for every GitHub call; transient 5xx and
+# 429 responses are retried with backoff before we ever see them.
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=16,
+        max_retries=Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 502, 503, 504],
+            raise_on_status=False,
+        ),
+    ),
+)
+
+# Request bodies are pre-serialized with _json_dumps, so label them ourselves.
+JSON_HEADERS = {"Content-Type": "application/json"}
+
 ISSUES_URL = f"https://api.github.com/repos/{OWNER}/{REPO}/issues"
+ISSUES_PER_PAGE = 100
+PAGE_FETCH_WORKERS = 8
 
 
 # ---------- Config helpers ----------
@@ -34,7 +81,7 @@ def load_pali_items():
         raise SystemExit(f"Config file not found: {PALI_CONFIG_PATH}")
 
     with open(PALI_CONFIG_PATH, "r", encoding="utf-8") as f:
-        data = yaml.safe_load(f)
+        data = yaml.load(f, Loader=_YamlLoader)
 
     items = data.get("items", [])
     normalized = []
@@ -118,6 +165,57 @@ def extract_pali_id_from_title(title: str) -> str | None:
     return None
 
 
+def _fetch_issue_page(page: int):
+    params = {
+        "state": "all",
+        "per_page": ISSUES_PER_PAGE,
+        "page": page,
+    }
+    resp = SESSION.get(ISSUES_URL, params=params)
+    if resp.status_code != 200:
+        raise SystemExit(f"Failed to list issues: {resp.status_code} {resp.text}")
+    return resp
+
+
+def _last_page_from_links(resp) -> int | None:
+    last = resp.links.get("last")
+    if not last:
+        return None
+    page = parse_qs(urlparse(last["url"]).query).get("page")
+    return int(page[0]) if page else None
+
+
+def _fetch_all_issue_pages() -> list[dict]:
+    """
+    Return every issue (open+closed, PRs included) in listing order.
+
+    Page 1's `Link: rel="last"` header gives the page count, so pages 2..N
+    are fetched concurrently. Without it we fall back to a serial crawl.
+    """
+    first = _fetch_issue_page(1)
+    issues = _json_loads(first.content)
+    if not issues:
+        return issues
+
+    last_page = _last_page_from_links(first)
+    if last_page is None:
+        page = 2
+        while True:
+            batch = _json_loads(_fetch_issue_page(page).content)
+            if not batch:
+                break
+            issues.extend(batch)
+            page += 1
+        return issues
+
+    if last_page > 1:
+        with ThreadPoolExecutor(max_workers=PAGE_FETCH_WORKERS) as pool:
+            for resp in pool.map(_fetch_issue_page, range(2, last_page + 1)):
+                issues.extend(_json_loads(resp.content))
+
+    return issues
+
+
 def get_existing_pali_map():
     """
     Fetch all issues (open+closed) and return a mapping:
@@ -126,33 +224,16 @@ def get_existing_pali_map():
     Currently we only track PALI-E* (epic-level items).
     """
     existing = {}
-    page = 1
-
-    while True:
-        params = {
-            "state": "all",
-            "per_page": 100,
-            "page": page,
-        }
-        resp = requests.get(ISSUES_URL, headers=HEADERS, params=params)
-        if resp.status_code != 200:
-            raise SystemExit(f"Failed to list issues: {resp.status_code} {resp.text}")
-
-        issues = resp.json()
-        if not issues:
-            break
-
-        for issue in issues:
-            if "pull_request" in issue:
-                continue
-
-            title = issue.get("title", "")
-            pali_id = extract_pali_id_from_title(title)
-            # Only track PALI-E* for now
-            if pali_id and pali_id.startswith("PALI-E") and pali_id not in existing:
-                existing[pali_id] = issue
-
-        page += 1
+
+    for issue in _fetch_all_issue_pages():
+        if "pull_request" in issue:
+            continue
+
+        title = issue.get("title", "")
+        pali_id = extract_pali_id_from_title(title)
+        # Only track PALI-E* for now
+        if pali_id and pali_id.startswith("PALI-E") and pali_id not in existing:
+            existing[pali_id] = issue
 
     return existing
 
@@ -164,23 +245,17 @@ def compute_labels(current_labels: list[str], priority: str) -> list[str]:
     Ensure Epics label + exactly one of P0/P1/P2.
     Don't touch any other labels.
     """
-    priority_label = priority  # e.g. "P0"
     priority_set = {"P0", "P1", "P2"}
 
-    new_labels = list(current_labels)
-
-    # Ensure Epics label
-    if EPIC_LABEL not in new_labels:
-        new_labels.append(EPIC_LABEL)
-
-    # Remove any existing priority labels
-    new_labels = [l for l in new_labels if l not in priority_set]
+    result = set(current_labels)
+    result.add(EPIC_LABEL)
 
-    # Add desired priority
-    if priority_label not in new_labels:
-        new_labels.append(priority_label)
+    # Replace any existing priority label with the desired one (e.g. "P0")
+    result -= priority_set
+    result.add(priority)
 
-    return new_labels
+    # Sorted so PATCH payloads are deterministic
+    return sorted(result)
 
 
 # ---------- Create / Update ----------
@@ -207,9 +282,9 @@ def create_pali_item(item: dict):
         "labels": labels,
     }
 
-    resp = requests.post(ISSUES_URL, headers=HEADERS, json=payload)
+    resp = SESSION.post(ISSUES_URL, data=_json_dumps(payload), headers=JSON_HEADERS)
     if resp.status_code == 201:
-        data = resp.json()
+        data = _json_loads(resp.content)
         print(f"[CREATE] {pali_id}: #{data['number']} → {data['html_url']}")
     else:
         print(f"[CREATE-FAILED] {pali_id}: {resp.status_code}")
@@ -232,26 +307,23 @@ def update_pali_item(issue: dict, item: dict):
     new_body = desired_issue_body(pali_id, phase, priority, title, description)
     new_labels = compute_labels(current_labels, priority)
 
-    needs_update = False
-    if current_title != new_title or current_body != new_body:
-        needs_update = True
-    if set(current_labels) != set(new_labels):
-        needs_update = True
+    # Only send the fields that changed; GitHub accepts partial PATCH bodies.
+    payload = {}
+    if current_title != new_title:
+        payload["title"] = new_title
+    if current_body != new_body:
+        payload["body"] = new_body
+    if frozenset(current_labels) != frozenset(new_labels):
+        payload["labels"] = new_labels
 
-    if not needs_update:
+    if not payload:
         print(f"[SKIP] {pali_id}: no changes")
         return
 
-    payload = {
-        "title": new_title,
-        "body": new_body,
-        "labels": new_labels,
-    }
-
     url = f"{ISSUES_URL}/{issue_number}"
-    resp = requests.patch(url, headers=HEADERS, json=payload)
+    resp = SESSION.patch(url, data=_json_dumps(payload), headers=JSON_HEADERS)
     if resp.status_code == 200:
-        print(f"[UPDATE] {pali_id}: issue #{issue_number} updated")
+        print(f"[UPDATE] {pali_id}: issue #{issue_number} updated ({', '.join(payload)})")
     else:
         print(f"[UPDATE-FAILED] {pali_id}: {resp.status_code}")
         print(resp.text)
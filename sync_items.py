@@ -1,10 +1,39 @@
+import functools
+import hashlib
+import json
 import os
 import re
+import shutil
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import parse_qs, urlparse
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import yaml
 from dotenv import load_dotenv
 
+# Prefer the libyaml-backed loader; fall back to pure Python if unavailable.
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+# Prefer orjson for (de)serializing JSON; fall back to the stdlib.
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
 # -------------------------------------------------
 # CONFIG – change these for other projects/repos
 # -------------------------------------------------
@@ -35,6 +64,8 @@ KIND_CONFIG = {
 }
 # -------------------------------------------------
 
+KIND_REGEX = {kind: re.compile(cfg["id_regex"]) for kind, cfg in KIND_CONFIG.items()}
+
 load_dotenv()
 
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
@@ -50,157 +81,268 @@ HEADERS = {
     "X-GitHub-Api-Version": "2022-11-28",
 }
 
+
+class GitHubRetry(Retry):
+    """
+    Besides the usual idempotent-method retries, also retry writes that
+    GitHub rejected for rate limiting (429, or a secondary-limit 403 with
+    Retry-After): those were never applied, so resending them is safe.
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if self.total and (status_code == 429 or (status_code == 403 and has_retry_after)):
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+# One keep-alive connection pool for every GitHub call; transient 5xx and
+# rate-limit responses are retried with backoff before we ever see them.
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=16,
+        max_retries=GitHubRetry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 502, 503, 504],
+            raise_on_status=False,
+        ),
+    ),
+)
+
+# Last core X-RateLimit-Remaining seen on any response (None until known).
+_last_remaining = None
+# Set by the preflight when the budget can't cover this run.
+_rate_limit_low = False
+
+
+def record_rate_limit(resp, *args, **kwargs):
+    """Session response hook: remember the remaining core rate-limit budget."""
+    global _last_remaining
+    remaining = resp.headers.get("X-RateLimit-Remaining")
+    # GraphQL has its own budget; only the REST core one drives concurrency.
+    if remaining is not None and resp.headers.get("X-RateLimit-Resource", "core") == "core":
+        _last_remaining = int(remaining)
+
+
+SESSION.hooks["response"].append(record_rate_limit)
+
+
+def pool_size(default: int) -> int:
+    """Thread-pool size to use now; drops when the rate-limit budget is short."""
+    if _rate_limit_low or (
+        _last_remaining is not None and _last_remaining < LOW_RATE_LIMIT_REMAINING
+    ):
+        return min(default, REDUCED_WORKERS)
+    return default
+
+
+# Request bodies are pre-serialized with _json_dumps, so label them ourselves.
+JSON_HEADERS = {"Content-Type": "application/json"}
+
 ISSUES_URL = f"https://api.github.com/repos/{OWNER}/{REPO}/issues"
+GRAPHQL_URL = "https://api.github.com/graphql"
+RATE_LIMIT_URL = "https://api.github.com/rate_limit"
+
+ISSUES_PER_PAGE = 100
+PAGE_FETCH_WORKERS = 8
+WRITE_WORKERS = 8  # stays under GitHub's concurrent-write abuse limits
+REDUCED_WORKERS = 2  # used instead when the rate-limit budget runs low
+LOW_RATE_LIMIT_REMAINING = 100
+
+# Opt-in: reuse a JSON copy of the flattened YAML while the YAML is unchanged.
+USE_YAML_CACHE = os.getenv("PALI_YAML_CACHE") == "1"
+
+# Opt-in: discover existing issues via GraphQL, fetching only the fields we use.
+USE_GRAPHQL = os.getenv("PALI_GRAPHQL") == "1"
+
+# Local state kept between runs (HTTP caches etc.); safe to delete at any time.
+CACHE_DIR = ".cache"
+ISSUE_PAGES_CACHE_DIR = os.path.join(CACHE_DIR, "issues_pages")
+SYNC_STATE_PATH = os.path.join(CACHE_DIR, "pali_sync_state.json")
+LINKED_PAIRS_PATH = os.path.join(CACHE_DIR, "linked_pairs.json")
+FINGERPRINTS_PATH = os.path.join(CACHE_DIR, "pali_fingerprints.json")
+
+# The since= delta never reports deleted or transferred issues, so the stored
+# issue list is rebuilt from a full crawl once it is older than this.
+SYNC_STATE_MAX_AGE = 7 * 24 * 60 * 60  # seconds
 
 
 # ---------- Load & flatten YAML ----------
 
+# (kind, key holding its children, parent-ID field those children get)
+YAML_LEVELS = [
+    ("epic", "stories", "epic_id"),
+    ("story", "tasks", "story_id"),
+    ("task", "subtasks", "task_id"),
+    ("subtask", None, None),
+]
+NO_PARENTS = {"epic_id": None, "story_id": None, "task_id": None}
+
+
+def yaml_cache_path(config_path: str) -> str:
+    # config/pali_items.yaml -> config/pali_items.cache.json
+    return os.path.splitext(config_path)[0] + ".cache.json"
+
+
+def read_yaml_cache(config_path: str):
+    """
+    Return the cached flat item list, or None if the cache is missing,
+    unreadable, or older than the YAML file.
+    """
+    cache_path = yaml_cache_path(config_path)
+    try:
+        if os.stat(cache_path).st_mtime < os.stat(config_path).st_mtime:
+            return None
+        with open(cache_path, "rb") as f:
+            return _json_loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def write_yaml_cache(config_path: str, flat):
+    cache_path = yaml_cache_path(config_path)
+    tmp_path = cache_path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(_json_dumps(flat))
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"[WARN] Could not write YAML cache {cache_path}: {e}")
+
+
 def load_flat_items(config_path: str):
     if not os.path.exists(config_path):
         raise SystemExit(f"Config file not found: {config_path}")
 
+    if USE_YAML_CACHE:
+        cached = read_yaml_cache(config_path)
+        if cached is not None:
+            return cached
+
     with open(config_path, "r", encoding="utf-8") as f:
-        data = yaml.safe_load(f) or {}
+        data = yaml.load(f, Loader=_YamlLoader) or {}
 
-    epics = data.get("epics", [])
+    epics = data.get("epics", []) or []
     flat = []
 
-    for epic in epics:
-        epic_id = epic["id"].strip()
-        epic_phase = epic["phase"].strip()
-        epic_priority = epic["priority"].strip()
-        epic_title = epic["title"].strip()
-        epic_desc = (epic.get("description") or "").strip()
+    # Depth-first walk in YAML order. Children inherit phase/priority from
+    # their parent when they don't set their own.
+    stack = [(0, epic, NO_PARENTS, None, None) for epic in reversed(epics)]
+    while stack:
+        depth, node, parents, parent_phase, parent_priority = stack.pop()
+        kind, children_key, parent_field = YAML_LEVELS[depth]
+
+        item_id = node["id"].strip()
+        if parent_phase is None:
+            # Epics must set phase/priority themselves.
+            phase = node["phase"].strip()
+            priority = node["priority"].strip()
+        else:
+            phase = (node.get("phase") or parent_phase).strip()
+            priority = (node.get("priority") or parent_priority).strip()
 
         flat.append(
             {
-                "id": epic_id,
-                "kind": "epic",
-                "phase": epic_phase,
-                "priority": epic_priority,
-                "title": epic_title,
-                "description": epic_desc,
-                "epic_id": None,
-                "story_id": None,
-                "task_id": None,
+                "id": item_id,
+                "kind": kind,
+                "phase": phase,
+                "priority": priority,
+                "title": node["title"].strip(),
+                "description": (node.get("description") or "").strip(),
+                **parents,
             }
         )
 
-        for story in epic.get("stories", []) or []:
-            story_id = story["id"].strip()
-            story_phase = (story.get("phase") or epic_phase).strip()
-            story_priority = (story.get("priority") or epic_priority).strip()
-            story_title = story["title"].strip()
-            story_desc = (story.get("description") or "").strip()
-
-            flat.append(
-                {
-                    "id": story_id,
-                    "kind": "story",
-                    "phase": story_phase,
-                    "priority": story_priority,
-                    "title": story_title,
-                    "description": story_desc,
-                    "epic_id": epic_id,
-                    "story_id": None,
-                    "task_id": None,
-                }
-            )
-
-            for task in story.get("tasks", []) or []:
-                task_id = task["id"].strip()
-                task_phase = (task.get("phase") or story_phase).strip()
-                task_priority = (task.get("priority") or story_priority).strip()
-                task_title = task["title"].strip()
-                task_desc = (task.get("description") or "").strip()
-
-                flat.append(
-                    {
-                        "id": task_id,
-                        "kind": "task",
-                        "phase": task_phase,
-                        "priority": task_priority,
-                        "title": task_title,
-                        "description": task_desc,
-                        "epic_id": epic_id,
-                        "story_id": story_id,
-                        "task_id": None,
-                    }
-                )
-
-                for sub in task.get("subtasks", []) or []:
-                    sub_id = sub["id"].strip()
-                    sub_phase = (sub.get("phase") or task_phase).strip()
-                    sub_priority = (sub.get("priority") or task_priority).strip()
-                    sub_title = sub["title"].strip()
-                    sub_desc = (sub.get("description") or "").strip()
-
-                    flat.append(
-                        {
-                            "id": sub_id,
-                            "kind": "subtask",
-                            "phase": sub_phase,
-                            "priority": sub_priority,
-                            "title": sub_title,
-                            "description": sub_desc,
-                            "epic_id": epic_id,
-                            "story_id": story_id,
-                            "task_id": task_id,
-                        }
-                    )
+        children = node.get(children_key) if children_key else None
+        if children:
+            child_parents = {**parents, parent_field: item_id}
+            for child in reversed(children):
+                stack.append((depth + 1, child, child_parents, phase, priority))
+
+    if USE_YAML_CACHE:
+        write_yaml_cache(config_path, flat)
 
     return flat
 
 
 # ---------- Helpers for title/body ----------
 
+KIND_WORDS = {
+    "epic": "Epic",
+    "story": "Story",
+    "task": "Task",
+    "subtask": "Sub-task",
+}
+
+
+@functools.cache
+def _render_title(item_id: str, title: str):
+    return f"[{item_id}] {title}"
+
+
 def desired_title(item):
-    return f"[{item['id']}] {item['title']}"
+    return _render_title(item["id"], item["title"])
+
+
+@functools.cache
+def _render_body(
+    item_id: str,
+    title: str,
+    kind: str,
+    phase: str,
+    priority: str,
+    description: str,
+    epic_id: str | None,
+    story_id: str | None,
+    task_id: str | None,
+    config_path: str,
+):
+    kind_word = KIND_WORDS[kind]
+    desc_block = description or "TODO: add a clear goal / description for this item."
+
+    # Optional parent lines, pre-rendered so the body is one f-string.
+    epic_line = f"**Epic:** {epic_id}  \n" if epic_id else ""
+    story_line = f"**Story:** {story_id}  \n" if story_id else ""
+    task_line = f"**Task:** {task_id}  \n" if task_id else ""
+
+    return (
+        f"# {item_id} – {title}\n"
+        "\n"
+        f"**ID:** {item_id}  \n"
+        f"**Kind:** {kind_word}  \n"
+        f"**Phase:** {phase}  \n"
+        f"**Priority:** {priority}  \n"
+        f"{epic_line}{story_line}{task_line}"
+        "\n"
+        "**Goal / Description**  \n"
+        f"{desc_block}\n"
+        "\n"
+        "---\n"
+        "\n"
+        f"This issue is fully managed by `{config_path}`.\n"
+        "Edit YAML, then rerun the sync script."
+    )
 
 
 def desired_body(item, config_path: str):
-    item_id = item["id"]
-    kind_word = {
-        "epic": "Epic",
-        "story": "Story",
-        "task": "Task",
-        "subtask": "Sub-task",
-    }[item["kind"]]
-    phase = item["phase"]
-    priority = item["priority"]
-    desc_block = item["description"] or "TODO: add a clear goal / description for this item."
-
-    lines = [
-        f"# {item_id} – {item['title']}",
-        "",
-        f"**ID:** {item_id}  ",
-        f"**Kind:** {kind_word}  ",
-        f"**Phase:** {phase}  ",
-        f"**Priority:** {priority}  ",
-    ]
-
-    if item["epic_id"]:
-        lines.append(f"**Epic:** {item['epic_id']}  ")
-    if item["story_id"]:
-        lines.append(f"**Story:** {item['story_id']}  ")
-    if item["task_id"]:
-        lines.append(f"**Task:** {item['task_id']}  ")
-
-    lines.extend(
-        [
-            "",
-            "**Goal / Description**  ",
-            desc_block,
-            "",
-            "---",
-            "",
-            f"This issue is fully managed by `{config_path}`.",
-            "Edit YAML, then rerun the sync script.",
-        ]
+    # Rendered once per distinct set of fields; repeat calls hit the cache.
+    return _render_body(
+        item["id"],
+        item["title"],
+        item["kind"],
+        item["phase"],
+        item["priority"],
+        item["description"],
+        item["epic_id"],
+        item["story_id"],
+        item["task_id"],
+        config_path,
     )
 
-    return "\n".join(lines)
-
 
 # ---------- Discover existing issues ----------
 
@@ -217,68 +359,358 @@ def extract_id_from_title(title: str):
     return first_token if first_token.startswith(BASE_ID_PREFIX) else None
 
 
-def get_existing_items_map(id_regex: re.Pattern):
-    existing = {}
+def _read_issue_pages_meta():
+    """
+    Return the issue-page cache metadata, wiping the cache first if it was
+    recorded for a different OWNER/REPO.
+    """
+    meta_path = os.path.join(ISSUE_PAGES_CACHE_DIR, "meta.json")
+    try:
+        with open(meta_path, "rb") as f:
+            meta = _json_loads(f.read())
+    except (OSError, ValueError):
+        meta = {}
+
+    if meta.get("repo") != f"{OWNER}/{REPO}":
+        shutil.rmtree(ISSUE_PAGES_CACHE_DIR, ignore_errors=True)
+        meta = {}
+    return meta
+
+
+def _write_issue_pages_meta(last_page):
+    os.makedirs(ISSUE_PAGES_CACHE_DIR, exist_ok=True)
+    meta_path = os.path.join(ISSUE_PAGES_CACHE_DIR, "meta.json")
+    with open(meta_path, "wb") as f:
+        f.write(_json_dumps({"repo": f"{OWNER}/{REPO}", "last_page": last_page}))
+
+
+def _issue_page_cache_base(page: int, since: str | None):
+    # Full-listing pages and since= delta pages are cached separately.
+    name = f"since-{page}" if since else str(page)
+    return os.path.join(ISSUE_PAGES_CACHE_DIR, name)
+
+
+def _write_issue_page_cache(base: str, resp):
+    os.makedirs(ISSUE_PAGES_CACHE_DIR, exist_ok=True)
+    etag = resp.headers.get("ETag")
+
+    # Body first, so a stored ETag never points at a missing/older body.
+    with open(base + ".json.tmp", "wb") as f:
+        f.write(resp.content)
+    os.replace(base + ".json.tmp", base + ".json")
+
+    if etag:
+        with open(base + ".etag", "w", encoding="utf-8") as f:
+            f.write(etag)
+    elif os.path.exists(base + ".etag"):
+        os.remove(base + ".etag")
+
+
+def _fetch_issue_page(page: int, since: str | None = None):
+    """
+    Return (issues, resp) for one page of the issues listing, optionally
+    limited to issues updated at or after `since`.
+
+    A stored ETag is sent as If-None-Match; on 304 Not Modified (which does
+    not count against the rate limit) the cached copy of the page is reused.
+    GitHub's ETags fingerprint the response body, so a 304 always means the
+    cached body is what this request would have returned.
+    """
+    params = {"state": "all", "per_page": ISSUES_PER_PAGE, "page": page}
+    if since:
+        params["since"] = since
+    base = _issue_page_cache_base(page, since)
+
+    headers = {}
+    try:
+        with open(base + ".etag", "r", encoding="utf-8") as f:
+            headers["If-None-Match"] = f.read().strip()
+    except OSError:
+        pass
+
+    resp = SESSION.get(ISSUES_URL, params=params, headers=headers)
+    if resp.status_code == 304:
+        try:
+            with open(base + ".json", "rb") as f:
+                return _json_loads(f.read()), resp
+        except (OSError, ValueError):
+            # Cached body is gone or corrupt; ask again unconditionally.
+            resp = SESSION.get(ISSUES_URL, params=params)
+
+    if resp.status_code != 200:
+        raise SystemExit(f"Failed to list issues: {resp.status_code} {resp.text}")
+
+    issues = _json_loads(resp.content)
+    _write_issue_page_cache(base, resp)
+    return issues, resp
+
+
+def _last_page_from_links(resp):
+    last = resp.links.get("last")
+    if not last:
+        return None
+    page = parse_qs(urlparse(last["url"]).query).get("page")
+    return int(page[0]) if page else None
+
+
+def _fetch_all_issue_pages():
+    """
+    Return every issue (open+closed, PRs included) in listing order.
+
+    Page 1's `Link: rel="last"` header gives the page count, so pages 2..N
+    are fetched concurrently. Without it we fall back to a serial crawl.
+    Unchanged pages are served from the local ETag cache.
+    """
+    meta = _read_issue_pages_meta()
+
+    issues, first = _fetch_issue_page(1)
+    if not issues:
+        return issues
+
+    if first.status_code == 304:
+        # Page 1 unchanged means no new issues, so the page count still holds.
+        last_page = meta.get("last_page")
+    else:
+        last_page = _last_page_from_links(first)
+        _write_issue_pages_meta(last_page)
+
+    if last_page is None:
+        page = 2
+        while True:
+            batch, _ = _fetch_issue_page(page)
+            if not batch:
+                break
+            issues.extend(batch)
+            page += 1
+        return issues
+
+    if last_page > 1:
+        with ThreadPoolExecutor(max_workers=pool_size(PAGE_FETCH_WORKERS)) as pool:
+            for batch, _ in pool.map(_fetch_issue_page, range(2, last_page + 1)):
+                issues.extend(batch)
+
+    return issues
+
+
+def _fetch_updated_issues(since: str):
+    """
+    Return every issue (PRs included) updated at or after `since`. When
+    nothing changed since the last run, `since` is unchanged too and the
+    pages come back 304 from the ETag cache.
+    """
+    _read_issue_pages_meta()  # drops the page cache if OWNER/REPO changed
+
+    issues = []
     page = 1
+    while True:
+        batch, _ = _fetch_issue_page(page, since)
+        if not batch:
+            break
+        issues.extend(batch)
+        page += 1
+    return issues
+
+
+def _slim_issue(issue):
+    """Keep only the issue fields this script reads, for the sync state file."""
+    return {
+        "number": issue["number"],
+        "id": issue["id"],
+        "node_id": issue.get("node_id"),
+        "title": issue.get("title", ""),
+        "body": issue.get("body"),
+        "labels": [{"name": lbl["name"]} for lbl in issue.get("labels", [])],
+        "state": issue.get("state"),
+        "updated_at": issue.get("updated_at"),
+    }
+
+
+def _read_sync_state():
+    try:
+        with open(SYNC_STATE_PATH, "rb") as f:
+            state = _json_loads(f.read())
+    except (OSError, ValueError):
+        return None
+    if state.get("repo") != f"{OWNER}/{REPO}" or not state.get("last_sync_at"):
+        return None
+    if time.time() - state.get("crawled_at", 0) > SYNC_STATE_MAX_AGE:
+        return None
+    return state
+
+
+def _write_sync_state(last_sync_at: str, issues_by_number, crawled_at: float):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    state = {
+        "repo": f"{OWNER}/{REPO}",
+        "last_sync_at": last_sync_at,
+        "crawled_at": crawled_at,
+        "issues": issues_by_number,
+    }
+    with open(SYNC_STATE_PATH + ".tmp", "wb") as f:
+        f.write(_json_dumps(state))
+    os.replace(SYNC_STATE_PATH + ".tmp", SYNC_STATE_PATH)
 
+
+def _load_rest_issues():
+    """
+    Return every issue (no PRs), newest first, from the REST API.
+
+    The first run does a full crawl and records it in SYNC_STATE_PATH.
+    Later runs only ask for issues updated since the last recorded
+    `updated_at` and merge them over the stored copy. Deleted or transferred
+    issues never show up in that delta, so the state is rebuilt from a full
+    crawl when _FULL_CRAWL is set (--prune/--force) or it is older than
+    SYNC_STATE_MAX_AGE.
+    """
+    state = None if _FULL_CRAWL else _read_sync_state()
+    if state is None:
+        issues_by_number = {}
+        last_sync_at = ""
+        crawled_at = time.time()
+        fetched = _fetch_all_issue_pages()
+    else:
+        issues_by_number = state["issues"]
+        last_sync_at = state["last_sync_at"]
+        crawled_at = state["crawled_at"]
+        fetched = _fetch_updated_issues(last_sync_at)
+
+    for issue in fetched:
+        if "pull_request" in issue:
+            continue
+        issues_by_number[str(issue["number"])] = _slim_issue(issue)
+        last_sync_at = max(last_sync_at, issue.get("updated_at") or "")
+
+    if last_sync_at:
+        _write_sync_state(last_sync_at, issues_by_number, crawled_at)
+
+    return sorted(issues_by_number.values(), key=lambda i: i["number"], reverse=True)
+
+
+ISSUES_QUERY = """
+query($owner: String!, $name: String!, $cursor: String, $labels: [String!]) {
+  repository(owner: $owner, name: $name) {
+    issues(
+      first: 100
+      after: $cursor
+      states: [OPEN, CLOSED]
+      filterBy: {labels: $labels}
+      orderBy: {field: CREATED_AT, direction: DESC}
+    ) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        number
+        databaseId
+        id
+        title
+        body
+        labels(first: 100) { nodes { name } }
+      }
+    }
+  }
+}
+"""
+
+
+def _iter_issues_graphql(label: str | None = None):
+    """
+    Yield issues from the GraphQL API, newest first (same order as the REST
+    listing), reshaped into the REST fields the rest of this script reads.
+    `id` is the REST id (databaseId) that the sub-issues endpoint expects.
+    With `label`, only issues carrying that label are returned.
+    """
+    cursor = None
     while True:
-        params = {"state": "all", "per_page": 100, "page": page}
-        resp = requests.get(ISSUES_URL, headers=HEADERS, params=params)
+        variables = {"owner": OWNER, "name": REPO, "cursor": cursor}
+        if label:
+            variables["labels"] = [label]
+        payload = {"query": ISSUES_QUERY, "variables": variables}
+        resp = SESSION.post(GRAPHQL_URL, data=_json_dumps(payload), headers=JSON_HEADERS)
         if resp.status_code != 200:
-            raise SystemExit(f"Failed to list issues: {resp.status_code} {resp.text}")
+            raise SystemExit(f"Failed to query issues: {resp.status_code} {resp.text}")
+
+        data = _json_loads(resp.content)
+        if data.get("errors"):
+            raise SystemExit(f"Failed to query issues: {data['errors']}")
+
+        issues = data["data"]["repository"]["issues"]
+        for node in issues["nodes"]:
+            yield {
+                "number": node["number"],
+                "id": node["databaseId"],
+                "node_id": node["id"],
+                "title": node["title"],
+                "body": node["body"],
+                "labels": node["labels"]["nodes"],
+            }
 
-        issues = resp.json()
-        if not issues:
-            break
+        if not issues["pageInfo"]["hasNextPage"]:
+            return
+        cursor = issues["pageInfo"]["endCursor"]
 
-        for issue in issues:
-            if "pull_request" in issue:
-                continue
 
-            title = issue.get("title", "")
-            item_id = extract_id_from_title(title)
-            if not item_id:
-                continue
+def iter_existing_issues():
+    """Yield every issue (open+closed, no pull requests), newest first."""
+    if USE_GRAPHQL:
+        yield from _iter_issues_graphql()
+        return
 
-            if not id_regex.match(item_id):
-                continue
+    yield from _load_rest_issues()
 
-            if item_id not in existing:
-                existing[item_id] = issue
 
-        page += 1
+# ID -> issue for the current run; filled by _fetch_all_issues_once(), reset in main().
+_ISSUE_MAP = None
+
+# Ignore the stored sync state and crawl every issue; set in main().
+_FULL_CRAWL = False
 
+
+def _map_issues_by_id(issues):
+    existing = {}
+    for issue in issues:
+        title = issue.get("title", "")
+        item_id = extract_id_from_title(title)
+        if not item_id:
+            continue
+        if item_id.startswith(BASE_ID_PREFIX) and item_id not in existing:
+            existing[item_id] = issue
     return existing
 
 
+def _fetch_all_issues_once():
+    """
+    Map every YAML-style ID (PALI-*) to its issue. GitHub is crawled on the
+    first call only; every kind and the sub-issue linking share the result.
+    """
+    global _ISSUE_MAP
+    if _ISSUE_MAP is None:
+        _ISSUE_MAP = _map_issues_by_id(iter_existing_issues())
+    return _ISSUE_MAP
+
+
+def get_existing_items_map(id_regex: re.Pattern, label: str | None = None):
+    """
+    Map this kind's IDs to their issues. With `label` (GraphQL discovery
+    only) GitHub returns just the issues carrying that label, instead of the
+    shared full crawl.
+    """
+    if label and USE_GRAPHQL:
+        issues_by_id = _map_issues_by_id(_iter_issues_graphql(label))
+    else:
+        issues_by_id = _fetch_all_issues_once()
+
+    return {
+        item_id: issue
+        for item_id, issue in issues_by_id.items()
+        if id_regex.match(item_id)
+    }
+
+
 def get_all_existing_items():
     """
     Map every YAML-style ID (PALI-*) to the full issue object.
     Used when wiring up sub-issue relationships.
     """
-    existing = {}
-    page = 1
-    while True:
-        params = {"state": "all", "per_page": 100, "page": page}
-        resp = requests.get(ISSUES_URL, headers=HEADERS, params=params)
-        if resp.status_code != 200:
-            raise SystemExit(f"Failed to list issues: {resp.status_code} {resp.text}")
-
-        issues = resp.json()
-        if not issues:
-            break
-
-        for issue in issues:
-            if "pull_request" in issue:
-                continue
-            title = issue.get("title", "")
-            item_id = extract_id_from_title(title)
-            if not item_id:
-                continue
-            if item_id.startswith(BASE_ID_PREFIX) and item_id not in existing:
-                existing[item_id] = issue
-        page += 1
-    return existing
+    return _fetch_all_issues_once()
 
 
 # ---------- Labels / priority / id-segment labels ----------
@@ -291,39 +723,156 @@ ID_SEGMENTS_RE = re.compile(
 def extract_id_segment_labels(item_id: str):
     """
     Turn 'PALI-E1-S5-T3-ST2' into ['E1', 'S5', 'T3', 'ST2'].
+
+    Malformed IDs (sync_kind only warns about them) get no segment labels.
     """
-    m = ID_SEGMENTS_RE.match(item_id)
-    if not m:
+    if not ID_SEGMENTS_RE.match(item_id):
         return []
-    return [g for g in m.groups() if g]
+    return item_id.split("-")[1:]
 
 
 def compute_labels(current_labels, item_label: str, priority: str, item_id: str):
-    new_labels = list(current_labels)
+    # Keep unrelated labels; ensure base label (Epics / Stories / ...) and
+    # ID segment labels (E1, S3, T2, ST1...).
+    result = set(current_labels)
+    result.add(item_label)
+    result.update(extract_id_segment_labels(item_id))
+
+    # Replace old priority labels with the current one
+    result -= PRIORITY_LABELS
+    if priority in PRIORITY_LABELS:
+        result.add(priority)
+    else:
+        print(f"[WARN] Unknown priority '{priority}'; expected one of {PRIORITY_LABELS}")
+
+    # Sorted so PATCH payloads are deterministic
+    return sorted(result)
 
-    # Ensure base label (Epics / Stories / Tasks / Sub-tasks)
-    if item_label not in new_labels:
-        new_labels.append(item_label)
 
-    # Ensure ID segment labels (E1, S3, T2, ST1...)
-    for seg in extract_id_segment_labels(item_id):
-        if seg not in new_labels:
-            new_labels.append(seg)
+REPO_LABELS_QUERY = """
+query($owner: String!, $name: String!, $cursor: String) {
+  repository(owner: $owner, name: $name) {
+    labels(first: 100, after: $cursor) {
+      pageInfo { hasNextPage endCursor }
+      nodes { id name }
+    }
+  }
+}
+"""
 
-    # Remove old priority labels
-    new_labels = [l for l in new_labels if l not in PRIORITY_LABELS]
+# label name -> GraphQL node ID; loaded once per run by repo_label_ids().
+_LABEL_IDS = None
+_LABEL_IDS_LOCK = threading.Lock()
 
-    # Add current priority
-    if priority in PRIORITY_LABELS and priority not in new_labels:
-        new_labels.append(priority)
-    elif priority not in PRIORITY_LABELS:
-        print(f"[WARN] Unknown priority '{priority}'; expected one of {PRIORITY_LABELS}")
 
-    return new_labels
+def repo_label_ids():
+    global _LABEL_IDS
+    with _LABEL_IDS_LOCK:
+        if _LABEL_IDS is not None:
+            return _LABEL_IDS
+
+        label_ids = {}
+        cursor = None
+        while True:
+            payload = {
+                "query": REPO_LABELS_QUERY,
+                "variables": {"owner": OWNER, "name": REPO, "cursor": cursor},
+            }
+            resp = SESSION.post(GRAPHQL_URL, data=_json_dumps(payload), headers=JSON_HEADERS)
+            data = _json_loads(resp.content) if resp.status_code == 200 else {}
+            if "data" not in data or data.get("errors"):
+                # Leave the map empty; label updates fall back to REST PATCH.
+                print(f"[WARN] Could not list repo labels: {resp.status_code} {resp.text}")
+                break
+
+            labels = data["data"]["repository"]["labels"]
+            for node in labels["nodes"]:
+                label_ids[node["name"]] = node["id"]
+            if not labels["pageInfo"]["hasNextPage"]:
+                break
+            cursor = labels["pageInfo"]["endCursor"]
+
+        _LABEL_IDS = label_ids
+        return _LABEL_IDS
+
+
+def update_labels_graphql(issue, current_labels, new_labels):
+    """
+    Apply a label-only change with addLabelsToLabelable /
+    removeLabelsFromLabelable in a single GraphQL request, sending just the
+    difference instead of the whole label set.
+
+    Returns None when this isn't possible (no node ID, or a label GitHub
+    doesn't know yet – REST PATCH creates those), else (ok, detail).
+    """
+    node_id = issue.get("node_id")
+    to_add = set(new_labels) - set(current_labels)
+    to_remove = set(current_labels) - set(new_labels)
+    label_ids = repo_label_ids()
+    if not node_id or any(name not in label_ids for name in to_add | to_remove):
+        return None
+
+    params = ["$id: ID!"]
+    fields = []
+    variables = {"id": node_id}
+    if to_add:
+        params.append("$add: [ID!]!")
+        fields.append(
+            "add: addLabelsToLabelable(input: {labelableId: $id, labelIds: $add})"
+            " { clientMutationId }"
+        )
+        variables["add"] = [label_ids[name] for name in sorted(to_add)]
+    if to_remove:
+        params.append("$remove: [ID!]!")
+        fields.append(
+            "remove: removeLabelsFromLabelable(input: {labelableId: $id, labelIds: $remove})"
+            " { clientMutationId }"
+        )
+        variables["remove"] = [label_ids[name] for name in sorted(to_remove)]
+
+    mutation = f"mutation({', '.join(params)}) {{ {' '.join(fields)} }}"
+    payload = {"query": mutation, "variables": variables}
+    resp = SESSION.post(GRAPHQL_URL, data=_json_dumps(payload), headers=JSON_HEADERS)
+    if resp.status_code != 200:
+        return False, f"{resp.status_code} {resp.text}"
+
+    data = _json_loads(resp.content)
+    if data.get("errors"):
+        return False, str(data["errors"])
+    return True, ""
 
 
 # ---------- Create / Update / Prune ----------
 
+# item ID -> {"number", "fp"} of the state last written/confirmed on GitHub.
+# Loaded and saved by main(); workers only set whole entries.
+_FINGERPRINTS = {}
+
+
+def item_fingerprint(title: str, body: str, labels) -> str:
+    data = title.encode() + b"|" + body.encode() + b"|" + "\0".join(sorted(labels)).encode()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _read_fingerprints():
+    try:
+        with open(FINGERPRINTS_PATH, "rb") as f:
+            data = _json_loads(f.read())
+    except (OSError, ValueError):
+        return {}
+    if data.get("repo") != f"{OWNER}/{REPO}":
+        return {}
+    return data.get("items", {})
+
+
+def _write_fingerprints(fingerprints):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    data = {"repo": f"{OWNER}/{REPO}", "items": fingerprints}
+    with open(FINGERPRINTS_PATH + ".tmp", "wb") as f:
+        f.write(_json_dumps(data))
+    os.replace(FINGERPRINTS_PATH + ".tmp", FINGERPRINTS_PATH)
+
+
 def create_item(item, item_label: str):
     issue_title = desired_title(item)
     body = desired_body(item, CONFIG_PATH)
@@ -331,16 +880,23 @@ def create_item(item, item_label: str):
 
     payload = {"title": issue_title, "body": body, "labels": labels}
 
-    resp = requests.post(ISSUES_URL, headers=HEADERS, json=payload)
+    resp = SESSION.post(ISSUES_URL, data=_json_dumps(payload), headers=JSON_HEADERS)
     if resp.status_code == 201:
-        data = resp.json()
+        data = _json_loads(resp.content)
         print(f"[CREATE] {item['id']}: #{data['number']} → {data['html_url']}")
+        _FINGERPRINTS[item["id"]] = {
+            "number": data["number"],
+            "fp": item_fingerprint(issue_title, body, labels),
+        }
+        # Make the new issue visible to later kinds and sub-issue linking.
+        if _ISSUE_MAP is not None:
+            _ISSUE_MAP[item["id"]] = data
     else:
         print(f"[CREATE-FAILED] {item['id']}: {resp.status_code}")
         print(resp.text)
 
 
-def update_item(issue, item, item_label: str):
+def update_item(issue, item, item_label: str, force: bool = False):
     issue_number = issue["number"]
     current_title = issue.get("title", "")
     current_labels = [lbl["name"] for lbl in issue.get("labels", [])]
@@ -349,28 +905,46 @@ def update_item(issue, item, item_label: str):
     new_body = desired_body(item, CONFIG_PATH)
     new_labels = compute_labels(current_labels, item_label, item["priority"], item["id"])
 
-    needs_update = False
+    # Same desired state as the last time we wrote/confirmed this issue:
+    # nothing to do. --force compares against GitHub's copy regardless.
+    fingerprint = {
+        "number": issue_number,
+        "fp": item_fingerprint(new_title, new_body, new_labels),
+    }
+    if not force and _FINGERPRINTS.get(item["id"]) == fingerprint:
+        print(f"[SKIP] {item['id']}: unchanged since last sync")
+        return
+
+    # Only send the fields that changed; GitHub accepts partial PATCH bodies.
+    payload = {}
     if current_title != new_title:
-        needs_update = True
+        payload["title"] = new_title
     if issue.get("body", "") != new_body:
-        needs_update = True
-    if set(current_labels) != set(new_labels):
-        needs_update = True
+        payload["body"] = new_body
+    if frozenset(current_labels) != frozenset(new_labels):
+        payload["labels"] = new_labels
 
-    if not needs_update:
+    if not payload:
         print(f"[SKIP] {item['id']}: no changes")
+        _FINGERPRINTS[item["id"]] = fingerprint
         return
 
-    payload = {
-        "title": new_title,
-        "body": new_body,
-        "labels": new_labels,
-    }
+    if list(payload) == ["labels"]:
+        result = update_labels_graphql(issue, current_labels, new_labels)
+        if result is not None:
+            ok, detail = result
+            if ok:
+                print(f"[UPDATE] {item['id']}: issue #{issue_number} updated (labels)")
+                _FINGERPRINTS[item["id"]] = fingerprint
+            else:
+                print(f"[UPDATE-FAILED] {item['id']}: {detail}")
+            return
 
     url = f"{ISSUES_URL}/{issue_number}"
-    resp = requests.patch(url, headers=HEADERS, json=payload)
+    resp = SESSION.patch(url, data=_json_dumps(payload), headers=JSON_HEADERS)
     if resp.status_code == 200:
-        print(f"[UPDATE] {item['id']}: issue #{issue_number} updated")
+        print(f"[UPDATE] {item['id']}: issue #{issue_number} updated ({', '.join(payload)})")
+        _FINGERPRINTS[item["id"]] = fingerprint
     else:
         print(f"[UPDATE-FAILED] {item['id']}: {resp.status_code}")
         print(resp.text)
@@ -389,7 +963,7 @@ def prune_items(kind: str, flat_items, existing_map):
         print(f"[PRUNE] Closing orphan {kind} {issue_id} (#{number})")
         url = f"{ISSUES_URL}/{number}"
         payload = {"state": "closed"}
-        resp = requests.patch(url, headers=HEADERS, json=payload)
+        resp = SESSION.patch(url, data=_json_dumps(payload), headers=JSON_HEADERS)
         if resp.status_code != 200:
             print(f"[PRUNE-FAILED] {issue_id}: {resp.status_code}")
             print(resp.text)
@@ -401,30 +975,68 @@ def add_sub_issue(parent_issue_number: int, child_issue_id: int):
     """
     Use GitHub's 'Add sub-issue' REST endpoint so that the child
     shows up in the Sub-issues panel, not just as text in the body.
+
+    Returns True only when the link exists afterwards (created now, or
+    GitHub says it already existed).
     """
     url = f"{ISSUES_URL}/{parent_issue_number}/sub_issues"
     payload = {"sub_issue_id": child_issue_id}
-    resp = requests.post(url, headers=HEADERS, json=payload)
+    resp = SESSION.post(url, data=_json_dumps(payload), headers=JSON_HEADERS)
 
     if resp.status_code == 201:
         print(f"[LINK] parent#{parent_issue_number} ← sub_id {child_issue_id}")
-    elif resp.status_code == 422:
-        # Validation failed – most likely the relationship already exists.
+        return True
+    elif resp.status_code == 422 and any(
+        word in resp.text.lower() for word in ("already", "duplicate")
+    ):
         print(f"[LINK-SKIP] relationship already exists for parent#{parent_issue_number}")
+        return True
     else:
+        # Any other failure (including other 422s, e.g. the child already
+        # has a different parent) is reported and retried on the next run.
         print(
             f"[LINK-FAILED] parent#{parent_issue_number} sub_id {child_issue_id}: "
             f"{resp.status_code}"
         )
         print(resp.text)
+        return False
+
+
+def _read_linked_pairs():
+    """Return the (parent_number, child_id) pairs linked by earlier runs."""
+    try:
+        with open(LINKED_PAIRS_PATH, "rb") as f:
+            data = _json_loads(f.read())
+    except (OSError, ValueError):
+        return set()
+    if data.get("repo") != f"{OWNER}/{REPO}":
+        return set()
+    return {tuple(pair) for pair in data.get("pairs", [])}
+
+
+def _write_linked_pairs(pairs):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    data = {"repo": f"{OWNER}/{REPO}", "pairs": sorted(pairs)}
+    with open(LINKED_PAIRS_PATH + ".tmp", "wb") as f:
+        f.write(_json_dumps(data))
+    os.replace(LINKED_PAIRS_PATH + ".tmp", LINKED_PAIRS_PATH)
 
 
 def sync_sub_issue_links(flat_items):
     """
     For each Story/Task/Subtask, attach it as a real sub-issue to its parent
     (Epic/Story/Task) using the REST sub-issues API.
+
+    Pairs linked by earlier runs are recorded in LINKED_PAIRS_PATH and not
+    sent again; delete that file to re-link everything.
     """
     all_issues = get_all_existing_items()
+    linked = _read_linked_pairs()
+    already_linked = len(linked)
+
+    # parent number -> child ids still to link, in YAML order
+    children_by_parent = {}
+    pending = set()
 
     for item in flat_items:
         kind = item["kind"]
@@ -449,42 +1061,129 @@ def sync_sub_issue_links(flat_items):
             print(f"[LINK-WARN] No parent issue found for {item_id} (parent {parent_key})")
             continue
 
-        parent_number = parent_issue["number"]
-        child_id = issue["id"]
-        add_sub_issue(parent_number, child_id)
+        pair = (parent_issue["number"], issue["id"])
+        if pair in linked or pair in pending:
+            continue
+        pending.add(pair)
+        children_by_parent.setdefault(pair[0], []).append(pair[1])
+
+    if already_linked:
+        print(f"{already_linked} relationship(s) already linked by earlier runs")
+    if not pending:
+        return
+
+    def link_children(parent_number, child_ids):
+        # Serial per parent so the Sub-issues panel keeps the YAML order.
+        for child_id in child_ids:
+            if add_sub_issue(parent_number, child_id):
+                linked.add((parent_number, child_id))
+
+    try:
+        with ThreadPoolExecutor(max_workers=pool_size(WRITE_WORKERS)) as pool:
+            futures = [
+                pool.submit(link_children, parent_number, child_ids)
+                for parent_number, child_ids in children_by_parent.items()
+            ]
+            for future in as_completed(futures):
+                future.result()
+    finally:
+        _write_linked_pairs(linked)
 
 
 # ---------- Run for one kind ----------
 
-def sync_kind(kind: str, flat_items, do_prune: bool):
+def sync_kind(kind: str, flat_items, do_prune: bool, force: bool = False, narrow: bool = False):
     cfg = KIND_CONFIG[kind]
     item_label = cfg["label"]
-    id_regex = re.compile(cfg["id_regex"])
+    id_regex = KIND_REGEX[kind]
 
     items_for_kind = [it for it in flat_items if it["kind"] == kind]
-    existing_map = get_existing_items_map(id_regex)
+    for item in items_for_kind:
+        if not id_regex.match(item["id"]):
+            print(f"[WARN] {item['id']}: does not look like a {kind} ID ({cfg['id_regex']})")
+
+    # A lone-kind GraphQL sync can ask only for issues with this kind's label.
+    # Pruning needs the full picture, and any YAML item missing from the
+    # narrowed view is re-checked against the full crawl so an issue whose
+    # label was removed by hand is updated rather than duplicated.
+    narrow = narrow and USE_GRAPHQL and not do_prune
+    existing_map = get_existing_items_map(id_regex, item_label if narrow else None)
+    if narrow and any(it["id"] not in existing_map for it in items_for_kind):
+        existing_map = get_existing_items_map(id_regex)
 
     print(
         f"Existing {kind} items found:",
         ", ".join(sorted(existing_map.keys())) or "none",
     )
 
+    # Creates stay serial so issue numbers follow YAML order (and GitHub asks
+    # for content-creating requests one at a time).
+    to_update = []
     for item in items_for_kind:
         existing = existing_map.get(item["id"])
         if existing is None:
             create_item(item, item_label)
         else:
-            update_item(existing, item, item_label)
+            to_update.append((existing, item))
+
+    # Each update writes a distinct issue, so those can run concurrently.
+    with ThreadPoolExecutor(max_workers=pool_size(WRITE_WORKERS)) as pool:
+        futures = [
+            pool.submit(update_item, existing, item, item_label, force)
+            for existing, item in to_update
+        ]
+        for future in as_completed(futures):
+            future.result()
 
     if do_prune:
         prune_items(kind, flat_items, existing_map)
 
 
+# ---------- Rate limit ----------
+
+def preflight_rate_limit(expected_calls: int):
+    """
+    Check the core budget before starting. If it can't cover roughly
+    `expected_calls`, wait for the reset when that's under a minute away,
+    otherwise continue with reduced concurrency.
+    """
+    global _rate_limit_low
+    _rate_limit_low = False
+
+    # /rate_limit itself doesn't count against the limit.
+    resp = SESSION.get(RATE_LIMIT_URL)
+    if resp.status_code != 200:
+        print(f"[WARN] Could not read rate limit: {resp.status_code}")
+        return
+
+    core = _json_loads(resp.content)["resources"]["core"]
+    remaining = core["remaining"]
+    if remaining >= expected_calls:
+        return
+
+    wait = core["reset"] - time.time()
+    if 0 < wait <= 60:
+        print(f"[RATE-LIMIT] {remaining} calls left, ~{expected_calls} needed; waiting {wait:.0f}s")
+        time.sleep(wait)
+    else:
+        print(
+            f"[RATE-LIMIT] {remaining} calls left, ~{expected_calls} needed; "
+            f"running with {REDUCED_WORKERS} workers"
+        )
+        _rate_limit_low = True
+
+
 # ---------- Main ----------
 
 def main():
+    global _ISSUE_MAP, _FINGERPRINTS, _LABEL_IDS, _FULL_CRAWL
+    _ISSUE_MAP = None
+    _LABEL_IDS = None
+
     if len(sys.argv) < 2:
-        raise SystemExit("Usage: python sync_items.py [epic|story|task|subtask|all] [--prune]")
+        raise SystemExit(
+            "Usage: python sync_items.py [epic|story|task|subtask|all] [--prune] [--force]"
+        )
 
     arg = sys.argv[1].lower()
     allowed = {"epic", "story", "task", "subtask", "all"}
@@ -492,23 +1191,35 @@ def main():
         raise SystemExit(f"Invalid kind '{arg}'. Use one of: epic, story, task, subtask, all")
 
     do_prune = "--prune" in sys.argv[2:]
+    # Ignore cached fingerprints and compare every item against GitHub.
+    force = "--force" in sys.argv[2:]
+    # Pruning and --force must see the real issue list, not a delta-merged copy.
+    _FULL_CRAWL = do_prune or force
 
     flat_items = load_flat_items(CONFIG_PATH)
+    _FINGERPRINTS = _read_fingerprints()
 
-    if arg == "all":
-        for kind in ["epic", "story", "task", "subtask"]:
-            print(f"\n=== Syncing {kind} (prune={do_prune}) ===")
-            sync_kind(kind, flat_items, do_prune)
+    # Rough budget: the listing pages plus a write and a link per item.
+    items_to_sync = [it for it in flat_items if arg == "all" or it["kind"] == arg]
+    preflight_rate_limit(len(flat_items) // ISSUES_PER_PAGE + 1 + 2 * len(items_to_sync))
 
-        # After everything exists / is updated, wire up parent-child links.
-        print("\n=== Syncing sub-issue relationships ===")
-        sync_sub_issue_links(flat_items)
-    else:
-        print(f"\n=== Syncing {arg} (prune={do_prune}) ===")
-        sync_kind(arg, flat_items, do_prune)
+    try:
+        if arg == "all":
+            for kind in ["epic", "story", "task", "subtask"]:
+                print(f"\n=== Syncing {kind} (prune={do_prune}) ===")
+                sync_kind(kind, flat_items, do_prune, force)
+
+            # After everything exists / is updated, wire up parent-child links.
+            print("\n=== Syncing sub-issue relationships ===")
+            sync_sub_issue_links(flat_items)
+        else:
+            print(f"\n=== Syncing {arg} (prune={do_prune}) ===")
+            sync_kind(arg, flat_items, do_prune, force, narrow=True)
 
-        # If you run per-kind, we don't touch sub-issue links automatically.
-        # Run `python sync_items.py all` occasionally to keep hierarchy wired.
+            # If you run per-kind, we don't touch sub-issue links automatically.
+            # Run `python sync_items.py all` occasionally to keep hierarchy wired.
+    finally:
+        _write_fingerprints(_FINGERPRINTS)
 
 
 if __name__ == "__main__":